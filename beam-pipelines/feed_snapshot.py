@@ -0,0 +1,434 @@
+"""
+Binary snapshot format for transformed GTFS feeds.
+The pipeline writes stops, routes, trips and stop times as flat NumPy arrays so
+that other processes can memory-map the feed instead of re-parsing the CSVs.
+
+Every write goes into a fresh version directory which is then published by
+atomically swapping the "current" symlink, so files that readers have mapped
+are never truncated or rewritten:
+
+    <snapshot_dir>/current -> snapshot-<time_ns>-<suffix>/
+
+Layout of a version directory:
+
+    manifest.json              format version, row counts and SHA-256 of every array
+    <table>.<column>.npy       fixed-width column (ints, floats)
+    <table>.<column>.offsets.npy / <table>.<column>.data.npy
+                               string table: UTF-8 bytes plus int64 offsets
+
+Ids are interned to their row index, so trips reference routes and stop times
+reference stops and trips by plain integers.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+CURRENT_LINK = "current"
+VERSION_PREFIX = "snapshot-"
+
+# Versions kept besides the current one, so readers that resolved the previous
+# link just before a swap can still open its files
+KEEP_PREVIOUS_VERSIONS = 1
+
+# Sentinel for missing integer references and unparseable times
+MISSING = -1
+
+
+class StringTable:
+    """Read-only view over a UTF-8 blob split by an offsets array"""
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("string table index out of range")
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.data[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def index(self) -> Dict[str, int]:
+        """Build a lookup from string value to row index"""
+        return {value: position for position, value in enumerate(self)}
+
+
+def _text(value: Any) -> str:
+    """
+    Normalize a cell to str. ReadFromCsv infers column types, so empty fields
+    arrive as NaN and numeric ids as ints or (next to empty cells) floats.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, (float, np.floating)):
+        if math.isnan(value):
+            return ""
+        if float(value).is_integer():
+            return str(int(value))
+    if isinstance(value, np.integer):
+        return str(int(value))
+    return str(value)
+
+
+def _int(value: Any, default: int = 0) -> int:
+    """Normalize an integer cell, using the GTFS default for empty (NaN) fields"""
+    if value is None or value == "":
+        return default
+    if isinstance(value, (float, np.floating)) and math.isnan(value):
+        return default
+    return int(value)
+
+
+def _encode_strings(values: Iterable[Any]) -> Dict[str, np.ndarray]:
+    encoded = [_text(value).encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return {"offsets": offsets, "data": data}
+
+
+def _first_by_id(rows: List[Dict[str, Any]], key: str) -> Dict[str, Dict[str, Any]]:
+    """Map each non-empty id to its first row, in first-seen order"""
+    unique: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        row_id = _text(row.get(key))
+        if row_id:
+            unique.setdefault(row_id, row)
+    return unique
+
+
+def _parse_gtfs_time(value: Any) -> int:
+    """Convert GTFS HH:MM:SS (hours may exceed 24) to seconds since midnight"""
+    try:
+        hours, minutes, seconds = (int(part) for part in value.strip().split(":"))
+        return hours * 3600 + minutes * 60 + seconds
+    except (AttributeError, ValueError):
+        return MISSING
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _log_dropped_rows(table_name: str, received: int, kept: int):
+    if kept < received:
+        logging.warning(
+            "Feed snapshot dropped %d of %d %s rows (unparsed, missing or duplicate id)",
+            received - kept,
+            received,
+            table_name,
+        )
+
+
+def _log_missing_references(column_name: str, references: np.ndarray):
+    missing = int(np.count_nonzero(references == MISSING))
+    if missing:
+        logging.warning(
+            "Feed snapshot has %d of %d %s references that did not resolve",
+            missing,
+            len(references),
+            column_name,
+        )
+
+
+def _build_tables(
+    stops: List[Dict[str, Any]],
+    routes: List[Dict[str, Any]],
+    trips: List[Dict[str, Any]],
+    stop_times: List[Dict[str, Any]],
+) -> Dict[str, Dict[str, np.ndarray]]:
+    stops_in, routes_in, trips_in, stop_times_in = stops, routes, trips, stop_times
+
+    # Keep the first occurrence of each id so row position == interned id.
+    # Transforms return {} for rows they could not parse, which drops them here.
+    stops_by_id = _first_by_id(stops, "stop_id")
+    routes_by_id = _first_by_id(routes, "route_id")
+    trips_by_id = _first_by_id(trips, "trip_id")
+
+    stop_index = {stop_id: index for index, stop_id in enumerate(stops_by_id)}
+    route_index = {route_id: index for index, route_id in enumerate(routes_by_id)}
+    trip_index = {trip_id: index for index, trip_id in enumerate(trips_by_id)}
+
+    stops = list(stops_by_id.values())
+    routes = list(routes_by_id.values())
+    trips = list(trips_by_id.values())
+
+    # Sort stop times by trip then sequence so each trip is a contiguous slice
+    stop_times = sorted(
+        (row for row in stop_times if _text(row.get("trip_id"))),
+        key=lambda row: (
+            trip_index.get(_text(row["trip_id"]), MISSING),
+            _int(row.get("stop_sequence")),
+        ),
+    )
+
+    tables = {
+        "stops": {
+            "stop_id": _encode_strings(stop_index),
+            "stop_name": _encode_strings(row.get("stop_name") for row in stops),
+            "stop_lat": np.array([row["stop_lat"] for row in stops], dtype=np.float64),
+            "stop_lon": np.array([row["stop_lon"] for row in stops], dtype=np.float64),
+            "location_type": np.array(
+                [_int(row.get("location_type")) for row in stops], dtype=np.int8
+            ),
+        },
+        "routes": {
+            "route_id": _encode_strings(route_index),
+            "route_name": _encode_strings(row.get("route_name") for row in routes),
+            "route_type": np.array(
+                [_int(row.get("route_type")) for row in routes], dtype=np.int16
+            ),
+            "agency_id": _encode_strings(row.get("agency_id") for row in routes),
+            "route_color": _encode_strings(row.get("route_color") for row in routes),
+            "route_text_color": _encode_strings(
+                row.get("route_text_color") for row in routes
+            ),
+        },
+        "trips": {
+            "trip_id": _encode_strings(trip_index),
+            "route": np.array(
+                [route_index.get(_text(row.get("route_id")), MISSING) for row in trips],
+                dtype=np.int32,
+            ),
+            "service_id": _encode_strings(row.get("service_id") for row in trips),
+            "trip_headsign": _encode_strings(row.get("trip_headsign") for row in trips),
+            "direction_id": np.array(
+                [_int(row.get("direction_id")) for row in trips], dtype=np.int8
+            ),
+            "block_id": _encode_strings(row.get("block_id") for row in trips),
+            "shape_id": _encode_strings(row.get("shape_id") for row in trips),
+        },
+        "stop_times": {
+            "trip": np.array(
+                [trip_index.get(_text(row["trip_id"]), MISSING) for row in stop_times],
+                dtype=np.int32,
+            ),
+            "stop": np.array(
+                [
+                    stop_index.get(_text(row.get("stop_id")), MISSING)
+                    for row in stop_times
+                ],
+                dtype=np.int32,
+            ),
+            "stop_sequence": np.array(
+                [_int(row.get("stop_sequence")) for row in stop_times], dtype=np.int32
+            ),
+            "arrival_time": np.array(
+                [_parse_gtfs_time(row.get("arrival_time")) for row in stop_times],
+                dtype=np.int32,
+            ),
+            "departure_time": np.array(
+                [_parse_gtfs_time(row.get("departure_time")) for row in stop_times],
+                dtype=np.int32,
+            ),
+        },
+    }
+
+    _log_dropped_rows("stops", len(stops_in), len(stops))
+    _log_dropped_rows("routes", len(routes_in), len(routes))
+    _log_dropped_rows("trips", len(trips_in), len(trips))
+    _log_dropped_rows("stop_times", len(stop_times_in), len(stop_times))
+    _log_missing_references("trips.route", tables["trips"]["route"])
+    _log_missing_references("stop_times.trip", tables["stop_times"]["trip"])
+    _log_missing_references("stop_times.stop", tables["stop_times"]["stop"])
+    return tables
+
+
+def write_snapshot(
+    output_dir: str,
+    stops: List[Dict[str, Any]],
+    routes: List[Dict[str, Any]],
+    trips: List[Dict[str, Any]],
+    stop_times: List[Dict[str, Any]],
+) -> str:
+    """Write feed rows as a new snapshot version, publish it and return its manifest path"""
+    os.makedirs(output_dir, exist_ok=True)
+    tables = _build_tables(stops, routes, trips, stop_times)
+    # Nanosecond prefix keeps versions ordered even within the same second
+    version_dir = tempfile.mkdtemp(
+        prefix=f"{VERSION_PREFIX}{time.time_ns():020d}-", dir=output_dir
+    )
+    try:
+        os.chmod(version_dir, 0o755)
+
+        manifest: Dict[str, Any] = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "tables": {},
+        }
+        for table_name, columns in tables.items():
+            table_manifest: Dict[str, Any] = {"rows": 0, "columns": {}}
+            for column_name, column in columns.items():
+                if isinstance(column, dict):
+                    parts = column
+                    kind = "string"
+                    rows = len(column["offsets"]) - 1
+                else:
+                    parts = {"values": column}
+                    kind = "array"
+                    rows = len(column)
+
+                files = {}
+                for part_name, array in parts.items():
+                    if kind == "string":
+                        file_name = f"{table_name}.{column_name}.{part_name}.npy"
+                    else:
+                        file_name = f"{table_name}.{column_name}.npy"
+                    path = os.path.join(version_dir, file_name)
+                    np.save(path, np.ascontiguousarray(array), allow_pickle=False)
+                    files[part_name] = {"file": file_name, "sha256": _sha256(path)}
+
+                table_manifest["rows"] = rows
+                table_manifest["columns"][column_name] = {"kind": kind, "files": files}
+            manifest["tables"][table_name] = table_manifest
+
+        # Written last and renamed into place: its presence marks a complete version
+        manifest_path = os.path.join(version_dir, MANIFEST_FILE)
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=2, sort_keys=True)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+        # Publish by swapping the symlink; readers see either version, never a mix
+        temp_link = os.path.join(output_dir, f".{CURRENT_LINK}.{os.getpid()}")
+        if os.path.lexists(temp_link):
+            os.remove(temp_link)
+        os.symlink(os.path.basename(version_dir), temp_link)
+        os.replace(temp_link, os.path.join(output_dir, CURRENT_LINK))
+    except BaseException:
+        # Never leave a half-written version behind to be mistaken for a real one
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+
+    _remove_old_versions(output_dir, os.path.basename(version_dir))
+
+    logging.info(
+        "Wrote feed snapshot to %s (%s)",
+        version_dir,
+        ", ".join(f"{name}: {t['rows']}" for name, t in manifest["tables"].items()),
+    )
+    return manifest_path
+
+
+def _remove_old_versions(output_dir: str, current: str):
+    """
+    Delete versions older than the ones kept. Unlinking does not affect
+    processes that already mapped the files; their pages stay valid.
+    """
+    # Only complete versions count; a writer may still be filling in another
+    versions = sorted(
+        name
+        for name in os.listdir(output_dir)
+        if name.startswith(VERSION_PREFIX)
+        and name != current
+        and os.path.exists(os.path.join(output_dir, name, MANIFEST_FILE))
+    )
+    stale = versions[: max(len(versions) - KEEP_PREVIOUS_VERSIONS, 0)]
+    for name in stale:
+        shutil.rmtree(os.path.join(output_dir, name), ignore_errors=True)
+
+
+def _resolve_version_dir(snapshot_dir: str) -> str:
+    """Follow the current link, or accept a version directory directly"""
+    current = os.path.join(snapshot_dir, CURRENT_LINK)
+    if os.path.lexists(current):
+        return os.path.realpath(current)
+    return snapshot_dir
+
+
+class FeedSnapshot:
+    """Memory-mapped view of a feed snapshot written by write_snapshot"""
+
+    def __init__(self, snapshot_dir: str, manifest: Dict[str, Any], tables: Dict):
+        self.snapshot_dir = snapshot_dir
+        self.manifest = manifest
+        self.tables = tables
+
+    def __getitem__(self, table_name: str) -> Dict[str, Any]:
+        return self.tables[table_name]
+
+    @property
+    def stops(self) -> Dict[str, Any]:
+        return self.tables["stops"]
+
+    @property
+    def routes(self) -> Dict[str, Any]:
+        return self.tables["routes"]
+
+    @property
+    def trips(self) -> Dict[str, Any]:
+        return self.tables["trips"]
+
+    @property
+    def stop_times(self) -> Dict[str, Any]:
+        return self.tables["stop_times"]
+
+    def trip_stop_times(self, trip: int) -> slice:
+        """Return the slice of stop_times rows belonging to an interned trip"""
+        trips = self.stop_times["trip"]
+        start = int(np.searchsorted(trips, trip, side="left"))
+        end = int(np.searchsorted(trips, trip, side="right"))
+        return slice(start, end)
+
+
+def load_snapshot(snapshot_dir: str, verify: bool = False) -> FeedSnapshot:
+    """
+    Memory-map the current feed snapshot without copying its arrays.
+    Pages are shared through the OS page cache across processes mapping the
+    same snapshot. Set verify to check content hashes against the manifest,
+    which reads every file and is therefore much slower.
+    """
+    # Resolve the link once so every file comes from the same version
+    snapshot_dir = _resolve_version_dir(snapshot_dir)
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), encoding="utf-8") as file:
+        manifest = json.load(file)
+
+    version = manifest.get("format_version")
+    if version != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported feed snapshot version {version}, "
+            f"expected {SNAPSHOT_FORMAT_VERSION}"
+        )
+
+    tables: Dict[str, Dict[str, Any]] = {}
+    for table_name, table_manifest in manifest["tables"].items():
+        columns: Dict[str, Any] = {}
+        for column_name, column in table_manifest["columns"].items():
+            arrays = {}
+            for part_name, entry in column["files"].items():
+                path = os.path.join(snapshot_dir, entry["file"])
+                if verify and _sha256(path) != entry["sha256"]:
+                    raise ValueError(f"Checksum mismatch for {entry['file']}")
+                arrays[part_name] = np.load(path, mmap_mode="r", allow_pickle=False)
+
+            if column["kind"] == "string":
+                columns[column_name] = StringTable(arrays["offsets"], arrays["data"])
+            else:
+                columns[column_name] = arrays["values"]
+        tables[table_name] = columns
+
+    return FeedSnapshot(snapshot_dir, manifest, tables)
@@ -0,0 +1,291 @@
+"""
+Tests for the binary feed snapshot writer and loader.
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from feed_snapshot import (
+    CURRENT_LINK,
+    MANIFEST_FILE,
+    MISSING,
+    SNAPSHOT_FORMAT_VERSION,
+    VERSION_PREFIX,
+    load_snapshot,
+    write_snapshot,
+)
+
+
+def sample_feed():
+    stops = [
+        {"stop_id": "A", "stop_name": "Ząbki", "stop_lat": 52.29, "stop_lon": 21.11},
+        {"stop_id": "B", "stop_name": "Wola", "stop_lat": 52.23, "stop_lon": 20.95},
+        {},
+        {"stop_id": "A", "stop_name": "duplicate", "stop_lat": 0.0, "stop_lon": 0.0},
+    ]
+    routes = [
+        {
+            "route_id": "R1",
+            "route_name": "175",
+            "route_type": 3,
+            "agency_id": "ZTM",
+            "route_color": "FF0000",
+            "route_text_color": "FFFFFF",
+        }
+    ]
+    trips = [
+        {"trip_id": "T1", "route_id": "R1", "service_id": "wk", "direction_id": 0},
+        {"trip_id": "T2", "route_id": "R9", "service_id": "wk", "direction_id": 1},
+    ]
+    stop_times = [
+        {
+            "trip_id": "T2",
+            "stop_id": "A",
+            "stop_sequence": 1,
+            "arrival_time": "07:00:00",
+            "departure_time": "07:00:30",
+        },
+        {
+            "trip_id": "T1",
+            "stop_id": "B",
+            "stop_sequence": 2,
+            "arrival_time": "25:01:00",
+            "departure_time": "25:02:00",
+        },
+        {
+            "trip_id": "T1",
+            "stop_id": "A",
+            "stop_sequence": 1,
+            "arrival_time": "08:00:00",
+            "departure_time": "",
+        },
+    ]
+    return stops, routes, trips, stop_times
+
+
+def test_round_trip(tmp_path):
+    write_snapshot(str(tmp_path), *sample_feed())
+    feed = load_snapshot(str(tmp_path), verify=True)
+
+    assert list(feed.stops["stop_id"]) == ["A", "B"]
+    assert list(feed.stops["stop_name"]) == ["Ząbki", "Wola"]
+    assert isinstance(feed.stops["stop_lat"], np.memmap)
+    np.testing.assert_allclose(feed.stops["stop_lat"], [52.29, 52.23])
+    np.testing.assert_allclose(feed.stops["stop_lon"], [21.11, 20.95])
+
+    assert feed.routes["route_color"][0] == "FF0000"
+    assert list(feed.trips["trip_id"]) == ["T1", "T2"]
+    assert list(feed.trips["route"]) == [0, MISSING]
+    assert list(feed.trips["direction_id"]) == [0, 1]
+
+
+def test_stop_times_are_interned_and_grouped_by_trip(tmp_path):
+    write_snapshot(str(tmp_path), *sample_feed())
+    feed = load_snapshot(str(tmp_path))
+    stop_times = feed.stop_times
+
+    assert list(stop_times["trip"]) == [0, 0, 1]
+    assert list(stop_times["stop"]) == [0, 1, 0]
+    assert list(stop_times["stop_sequence"]) == [1, 2, 1]
+
+    first_trip = feed.trip_stop_times(0)
+    assert first_trip == slice(0, 2)
+    assert list(stop_times["arrival_time"][first_trip]) == [8 * 3600, 25 * 3600 + 60]
+    assert list(stop_times["departure_time"][first_trip]) == [MISSING, 25 * 3600 + 120]
+    assert feed.trip_stop_times(1) == slice(2, 3)
+    assert feed.trip_stop_times(5) == slice(3, 3)
+
+
+def test_nan_and_numeric_ids_are_normalized(tmp_path):
+    stops = [
+        {"stop_id": np.int64(101), "stop_name": "Centrum", "stop_lat": 1.0, "stop_lon": 2.0},
+        {"stop_id": 0, "stop_name": float("nan"), "stop_lat": 3.0, "stop_lon": 4.0},
+        {"stop_id": float("nan"), "stop_name": "no id", "stop_lat": 5.0, "stop_lon": 6.0},
+    ]
+    routes = [
+        {
+            "route_id": np.int64(7),
+            "route_name": "7",
+            "route_type": 0,
+            "agency_id": float("nan"),
+            "route_color": float("nan"),
+            "route_text_color": float("nan"),
+        }
+    ]
+    trips = [
+        {
+            "trip_id": 55.0,
+            "route_id": 7,
+            "service_id": "wk",
+            "trip_headsign": float("nan"),
+            "block_id": float("nan"),
+            "shape_id": np.nan,
+        }
+    ]
+    stop_times = [
+        {
+            "trip_id": np.int64(55),
+            "stop_id": 0,
+            "stop_sequence": 1,
+            "arrival_time": float("nan"),
+            "departure_time": "06:00:00",
+        }
+    ]
+    write_snapshot(str(tmp_path), stops, routes, trips, stop_times)
+    feed = load_snapshot(str(tmp_path))
+
+    assert list(feed.stops["stop_id"]) == ["101", "0"]
+    assert list(feed.stops["stop_name"]) == ["Centrum", ""]
+    assert feed.routes["route_id"][0] == "7"
+    assert feed.routes["route_color"][0] == ""
+    assert feed.trips["trip_id"][0] == "55"
+    assert feed.trips["block_id"][0] == ""
+    assert list(feed.trips["route"]) == [0]
+    assert list(feed.stop_times["trip"]) == [0]
+    assert list(feed.stop_times["stop"]) == [1]
+    assert list(feed.stop_times["arrival_time"]) == [MISSING]
+
+
+def test_empty_tables(tmp_path):
+    write_snapshot(str(tmp_path), [], [], [], [])
+    feed = load_snapshot(str(tmp_path))
+
+    assert len(feed.stops["stop_id"]) == 0
+    assert len(feed.stops["stop_lat"]) == 0
+    assert len(feed.stop_times["trip"]) == 0
+    assert feed.manifest["tables"]["stops"]["rows"] == 0
+
+
+def test_string_table_indexing(tmp_path):
+    write_snapshot(str(tmp_path), *sample_feed())
+    names = load_snapshot(str(tmp_path)).stops["stop_name"]
+
+    assert names[-1] == "Wola"
+    assert names[-2] == "Ząbki"
+    assert names.index() == {"Ząbki": 0, "Wola": 1}
+    with pytest.raises(IndexError):
+        names[2]
+    with pytest.raises(IndexError):
+        names[-3]
+
+
+def test_manifest_records_hashes(tmp_path):
+    write_snapshot(str(tmp_path), *sample_feed())
+    feed = load_snapshot(str(tmp_path))
+
+    assert feed.manifest["format_version"] == SNAPSHOT_FORMAT_VERSION
+    assert feed.manifest["tables"]["stops"]["rows"] == 2
+    entry = feed.manifest["tables"]["stops"]["columns"]["stop_lat"]["files"]["values"]
+    assert len(entry["sha256"]) == 64
+    assert os.path.exists(os.path.join(feed.snapshot_dir, entry["file"]))
+
+
+def test_verify_detects_checksum_mismatch(tmp_path):
+    write_snapshot(str(tmp_path), *sample_feed())
+    version_dir = load_snapshot(str(tmp_path)).snapshot_dir
+
+    path = os.path.join(version_dir, "stops.stop_lat.npy")
+    data = bytearray(open(path, "rb").read())
+    data[-1] ^= 0xFF
+    with open(path, "wb") as file:
+        file.write(data)
+
+    load_snapshot(str(tmp_path))
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        load_snapshot(str(tmp_path), verify=True)
+
+
+def test_unsupported_version_is_rejected(tmp_path):
+    write_snapshot(str(tmp_path), *sample_feed())
+    manifest_path = os.path.join(load_snapshot(str(tmp_path)).snapshot_dir, MANIFEST_FILE)
+    with open(manifest_path, encoding="utf-8") as file:
+        manifest = json.load(file)
+    manifest["format_version"] = SNAPSHOT_FORMAT_VERSION + 1
+    with open(manifest_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+
+    with pytest.raises(ValueError, match="Unsupported feed snapshot version"):
+        load_snapshot(str(tmp_path))
+
+
+def test_rewrite_publishes_new_version_without_touching_mapped_files(tmp_path):
+    stops, routes, trips, stop_times = sample_feed()
+    write_snapshot(str(tmp_path), stops, routes, trips, stop_times)
+    old = load_snapshot(str(tmp_path))
+    old_lat = old.stops["stop_lat"]
+
+    stops = [dict(row, stop_lat=0.5) for row in stops if row]
+    write_snapshot(str(tmp_path), stops, routes, trips, stop_times)
+    new = load_snapshot(str(tmp_path))
+
+    assert new.snapshot_dir != old.snapshot_dir
+    np.testing.assert_allclose(new.stops["stop_lat"], [0.5, 0.5])
+    np.testing.assert_allclose(old_lat, [52.29, 52.23])
+    assert os.path.realpath(os.path.join(tmp_path, CURRENT_LINK)) == new.snapshot_dir
+
+
+def test_rewrite_keeps_only_recent_versions(tmp_path):
+    for _ in range(4):
+        write_snapshot(str(tmp_path), *sample_feed())
+
+    versions = [name for name in os.listdir(tmp_path) if name.startswith(VERSION_PREFIX)]
+    assert len(versions) == 2
+    assert os.path.basename(load_snapshot(str(tmp_path)).snapshot_dir) == max(versions)
+
+
+def test_nan_integer_fields_default_to_zero(tmp_path):
+    stops, routes, trips, stop_times = sample_feed()
+    stops[0]["location_type"] = float("nan")
+    trips[0]["direction_id"] = np.float64("nan")
+    write_snapshot(str(tmp_path), stops, routes, trips, stop_times)
+    feed = load_snapshot(str(tmp_path))
+
+    assert list(feed.stops["location_type"]) == [0, 0]
+    assert list(feed.trips["direction_id"]) == [0, 1]
+
+
+def test_dropped_rows_and_missing_references_are_logged(tmp_path, caplog):
+    stops, routes, trips, stop_times = sample_feed()
+    stop_times.append({"trip_id": "T9", "stop_id": "Z", "stop_sequence": 1})
+    with caplog.at_level("WARNING"):
+        write_snapshot(str(tmp_path), stops, routes, trips, stop_times)
+
+    assert "dropped 2 of 4 stops rows" in caplog.text
+    assert "1 of 2 trips.route references" in caplog.text
+    assert "1 of 4 stop_times.trip references" in caplog.text
+    assert "1 of 4 stop_times.stop references" in caplog.text
+
+
+def test_failed_write_leaves_no_version_behind(tmp_path, monkeypatch):
+    import feed_snapshot
+
+    write_snapshot(str(tmp_path), *sample_feed())
+    previous = load_snapshot(str(tmp_path)).snapshot_dir
+
+    def failing_save(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(feed_snapshot.np, "save", failing_save)
+    with pytest.raises(OSError, match="disk full"):
+        write_snapshot(str(tmp_path), *sample_feed())
+    monkeypatch.undo()
+
+    versions = [name for name in os.listdir(tmp_path) if name.startswith(VERSION_PREFIX)]
+    assert versions == [os.path.basename(previous)]
+    assert load_snapshot(str(tmp_path)).snapshot_dir == previous
+
+
+def test_incomplete_versions_do_not_displace_previous(tmp_path):
+    write_snapshot(str(tmp_path), *sample_feed())
+    previous = load_snapshot(str(tmp_path)).snapshot_dir
+    # A version another writer is still filling in sorts after the previous one
+    incomplete = os.path.join(tmp_path, f"{VERSION_PREFIX}{'9' * 20}-writing")
+    os.mkdir(incomplete)
+
+    write_snapshot(str(tmp_path), *sample_feed())
+
+    assert os.path.exists(os.path.join(previous, MANIFEST_FILE))
+    assert os.path.isdir(incomplete)
@@ -0,0 +1,118 @@
+"""
+Tests for the transport pipeline transforms and feed snapshot wiring.
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+pytest.importorskip("apache_beam")
+pytest.importorskip("psycopg2")
+pytest.importorskip("neo4j")
+
+import transport_pipeline  # noqa: E402
+from feed_snapshot import MISSING, load_snapshot, write_snapshot  # noqa: E402
+
+
+GTFS_FIXTURE = {
+    "stops.csv": (
+        "stop_id,stop_name,stop_lat,stop_lon,location_type\n"
+        "101,Centrum,52.23,21.01,\n"
+        "102,Wola,52.24,20.95,1\n"
+    ),
+    "routes.csv": (
+        "route_id,route_name,route_type,agency_id,route_color,route_text_color\n"
+        "R1,175,3,ZTM,,\n"
+    ),
+    "trips.csv": (
+        "trip_id,route_id,service_id,trip_headsign,direction_id,block_id,shape_id\n"
+        "T1,R1,wk,Wola,,,\n"
+        "T2,R1,wk,Centrum,1,,\n"
+    ),
+    "stop_times.csv": (
+        "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+        "T1,25:01:00,25:02:00,102,2\n"
+        "T1,08:00:00,08:00:30,101,1\n"
+        "T2,09:00:00,09:00:00,102,1\n"
+    ),
+}
+
+
+def test_transforms_default_empty_optional_integers():
+    stop = transport_pipeline.transform_stop_data(
+        {
+            "stop_id": "101",
+            "stop_name": "Centrum",
+            "stop_lat": 52.23,
+            "stop_lon": 21.01,
+            "location_type": float("nan"),
+        }
+    )
+    trip = transport_pipeline.traansform_trips_data(
+        {"trip_id": "T1", "route_id": "R1", "direction_id": np.float64("nan")}
+    )
+
+    assert stop["location_type"] == 0
+    assert trip["direction_id"] == 0
+
+
+def test_transformed_rows_with_empty_optional_integers_reach_snapshot(tmp_path):
+    stops = [
+        transport_pipeline.transform_stop_data(
+            {
+                "stop_id": 101,
+                "stop_name": "Centrum",
+                "stop_lat": 52.23,
+                "stop_lon": 21.01,
+                "location_type": math.nan,
+            }
+        )
+    ]
+    trips = [
+        transport_pipeline.traansform_trips_data(
+            {"trip_id": "T1", "route_id": "R1", "direction_id": math.nan}
+        )
+    ]
+    stop_times = [
+        transport_pipeline.transform_stop_times_data(
+            {"trip_id": "T1", "stop_id": 101, "stop_sequence": 1}
+        )
+    ]
+    write_snapshot(str(tmp_path), stops, [], trips, stop_times)
+    feed = load_snapshot(str(tmp_path))
+
+    assert list(feed.stops["stop_id"]) == ["101"]
+    assert list(feed.trips["trip_id"]) == ["T1"]
+    assert list(feed.stop_times["trip"]) == [0]
+    assert list(feed.stop_times["stop"]) == [0]
+
+
+def test_run_pipeline_writes_snapshot(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for name, content in GTFS_FIXTURE.items():
+        (data_dir / name).write_text(content, encoding="utf-8")
+    # The pipeline reads data/<table>.csv relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    # No database in tests; the stops branch still runs with the write skipped
+    monkeypatch.setattr(transport_pipeline.WriteToPostGIS, "setup", lambda self: None)
+
+    snapshot_dir = str(tmp_path / "snapshot")
+    transport_pipeline.run_pipeline(snapshot_dir=snapshot_dir)
+    feed = load_snapshot(snapshot_dir, verify=True)
+
+    assert sorted(feed.stops["stop_id"]) == ["101", "102"]
+    assert sorted(feed.stops["location_type"]) == [0, 1]
+    assert list(feed.routes["route_id"]) == ["R1"]
+    assert list(feed.routes["route_color"]) == [""]
+    assert sorted(feed.trips["trip_id"]) == ["T1", "T2"]
+    assert sorted(feed.trips["direction_id"]) == [0, 1]
+    assert MISSING not in feed.trips["route"]
+    assert MISSING not in feed.stop_times["trip"]
+    assert MISSING not in feed.stop_times["stop"]
+
+    t1 = feed.trips["trip_id"].index()["T1"]
+    rows = feed.trip_stop_times(t1)
+    assert list(feed.stop_times["stop_sequence"][rows]) == [1, 2]
+    assert list(feed.stop_times["arrival_time"][rows]) == [8 * 3600, 25 * 3600 + 60]
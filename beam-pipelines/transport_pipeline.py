@@ -8,12 +8,21 @@ from apache_beam.io import ReadFromText
 from apache_beam.options.pipeline_options import PipelineOptions
 import json
 import logging
+import math
+import os
 import psycopg2
 from neo4j import GraphDatabase
 from typing import Dict, Any, List
 from apache_beam.io import ReadFromCsv
 from datetime import datetime
 
+try:
+    # Launched as a module from /app (python -m pipelines.transport_pipeline)
+    from pipelines.feed_snapshot import write_snapshot
+except ImportError:
+    # Launched as a script from the beam-pipelines directory
+    from feed_snapshot import write_snapshot
+
 
 class DatabaseConfig:
     """Configuration for database connections"""
@@ -59,6 +68,13 @@ class DatabaseConfig:
 #             logging.error(f"Error transforming stop data: {e}")
 
 
+def optional_int(value, default: int = 0) -> int:
+    """Parse an optional GTFS integer field; ReadFromCsv yields NaN for empty cells"""
+    if value is None or value == "" or (isinstance(value, float) and math.isnan(value)):
+        return default
+    return int(value)
+
+
 def transform_stop_data(element):
     """Transform raw stop data into structured format"""
 
@@ -70,7 +86,7 @@ def transform_stop_data(element):
             "stop_name": element.get("stop_name"),
             "stop_lat": float(element.get("stop_lat", 0)),
             "stop_lon": float(element.get("stop_lon", 0)),
-            "location_type": int(element.get("location_type", 0)),
+            "location_type": optional_int(element.get("location_type")),
         }
 
         # Add geospatial point
@@ -132,7 +148,7 @@ def traansform_trips_data(element: Dict[str, Any]) -> Dict[str, Any]:
             "route_id": element.get("route_id"),
             "service_id": element.get("service_id"),
             "trip_headsign": element.get("trip_headsign", ""),
-            "direction_id": int(element.get("direction_id", 0)),
+            "direction_id": optional_int(element.get("direction_id")),
             "block_id": element.get("block_id", ""),
             "shape_id": element.get("shape_id", ""),
         }
@@ -399,7 +415,36 @@ class WriteStopTimesDataToNeo4j(beam.DoFn):
             self.driver.close()
 
 
-def run_pipeline(input_file: str = None):
+def build_feed_snapshot(pipeline, stops_data, snapshot_dir: str):
+    """Collect all transformed GTFS tables and write them as a binary snapshot"""
+
+    def read_table(name: str, transform):
+        return (
+            pipeline
+            | f"Read {name} for Snapshot" >> ReadFromCsv(f"data/{name}.csv", header=0)
+            | f"Convert {name} to Dict" >> beam.Map(lambda row: row._asdict())
+            | f"Transform {name} for Snapshot" >> beam.Map(transform)
+        )
+
+    routes = read_table("routes", transform_routes_data)
+    trips = read_table("trips", traansform_trips_data)
+    stop_times = read_table("stop_times", transform_stop_times_data)
+
+    return (
+        pipeline
+        | "Snapshot Directory" >> beam.Create([snapshot_dir])
+        | "Write Feed Snapshot"
+        >> beam.Map(
+            write_snapshot,
+            stops=beam.pvalue.AsList(stops_data),
+            routes=beam.pvalue.AsList(routes),
+            trips=beam.pvalue.AsList(trips),
+            stop_times=beam.pvalue.AsList(stop_times),
+        )
+    )
+
+
+def run_pipeline(input_file: str = None, snapshot_dir: str = None):
     """Run the Apache Beam pipeline"""
 
     pipeline_options = PipelineOptions(
@@ -455,6 +500,10 @@ def run_pipeline(input_file: str = None):
         # Write to PostGIS
         (stops_data | "Write to PostGIS" >> beam.ParDo(WriteToPostGIS()))
 
+        # Write memory-mappable snapshot for fast reloads
+        if snapshot_dir:
+            build_feed_snapshot(pipeline, stops_data, snapshot_dir)
+
         # # Write to Neo4j
         # (stops_data | "Write to Neo4j" >> beam.ParDo(WriteToNeo4j()))
         # (trips_data | "Write to Neo4j" >> beam.ParDo(WriteTripsToNeo4j()))
@@ -468,4 +517,4 @@ def run_pipeline(input_file: str = None):
 
 if __name__ == "__main__":
     logging.getLogger().setLevel(logging.INFO)
-    run_pipeline()
+    run_pipeline(snapshot_dir=os.environ.get("FEED_SNAPSHOT_DIR"))